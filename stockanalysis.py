@@ -1,8 +1,17 @@
 import os
+import contextlib
+import functools
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import tempfile
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from numba import njit
+from xlsxwriter.utility import xl_col_to_name
 warnings.filterwarnings("ignore")
 
 # ==================================================
@@ -11,20 +20,49 @@ warnings.filterwarnings("ignore")
 DATA_FOLDER = "data_folder"  # Generic folder name - place CSV files here
 OUTPUT_FILE = "compiled_analysis_report.xlsx"
 
+# Rolling window for the OI average used to normalize OI changes
+OI_AVG_WINDOW = 20
+OI_AVG_MIN_PERIODS = 5
+
+# Only these columns are parsed from each CSV (matched after stripping spaces)
+CSV_COLUMNS = ["Date", "Expiry", "Expiry_Date", "Open", "Close", "No. of contracts", "Open Int"]
+
+# Derived signals stored as float32
+FLOAT32_COLUMNS = [
+    "Daily_Change", "Volume_Pct_Change", "OI_Change", "OI_20D_Avg", "OI_Normalized_Change",
+    "Next_Day_OI", "Next_Day_OI_Change", "Next_Day_OI_Normalized_Change",
+    "Next_Day_Volume", "Next_Day_Volume_Pct_Change",
+]
+
+# Staged parquet dtypes, fixed so every file's schema merges with the others
+STAGED_FLOAT64_COLUMNS = ["Open", "Close", "No. of contracts", "Open Int"]
+STAGED_DATETIME_COLUMNS = ["Date", "Expiry", "Expiry_Date", "Contract_ID"]
+
+# Report layouts (after-loss metrics first, then after-gain)
+METRIC_COLS = (
+    'Avg_OI_Percentile_AfterLoss', 'Avg_NextDay_Volume_Change_AfterLoss',
+    'Avg_NextDay_OI_Normalized_AfterLoss', 'Pct_OI_Increase_AfterLoss',
+    'Avg_OI_Percentile_AfterGain', 'Avg_NextDay_Volume_Change_AfterGain',
+    'Avg_NextDay_OI_Normalized_AfterGain', 'Pct_OI_Increase_AfterGain',
+)
+REPORT_COLS = ('Instrument', 'Base_Instrument', 'Contract_ID', 'Total_Days', 'Loss_Days', 'Gain_Days') + METRIC_COLS
+YEARWISE_COLS = ('Instrument', 'Year', 'Period', 'Total_Days', 'Loss_Days', 'Gain_Days') + METRIC_COLS
+
 # ==================================================
 # HELPER FUNCTIONS
 # ==================================================
+@functools.lru_cache(maxsize=None)
 def extract_base_instrument(filename):
     """
     Extracts the base instrument name from the CSV filename.
     Example: 'FUTIDX_BANKNIFTY_01-Apr-2024_TO_30-Jun-2024.csv' -> 'BANKNIFTY'
     Example: 'FUTSTK_TATAMOTORS_01-Jan-2022_TO_31-Mar-2022.csv' -> 'TATAMOTORS'
     """
-    # Remove .csv extension
-    name = filename.replace('.csv', '')
+    # Remove .csv extension (slicing avoids building an intermediate string)
+    name = filename[:-4] if filename.endswith('.csv') else filename
     
-    # Split by underscore
-    parts = name.split('_')
+    # Split by underscore; only the first two parts are needed
+    parts = name.split('_', 2)
     
     # The instrument name is the second part (after FUTIDX or FUTSTK)
     if len(parts) >= 2:
@@ -32,121 +70,366 @@ def extract_base_instrument(filename):
     
     return name
 
+
+def read_futures_csv(file_path):
+    """
+    Reads only the columns used by the analysis from a futures CSV file.
+    NSE headers carry trailing spaces, so the header row is read first to
+    map the stripped names back to the raw ones.
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    usecols = [col for col in header if col.strip() in CSV_COLUMNS]
+
+    # NSE marks missing values with '-'
+    return pd.read_csv(file_path, engine="pyarrow", usecols=usecols, na_values=["-"])
+
+
+def parse_expiry(expiry):
+    """
+    Parses expiry strings in NSE's '%d-%b-%Y' form.
+    If any expiry is in another format, the raw values are returned unchanged
+    so they still work as contract keys instead of turning into NaT.
+    """
+    parsed = pd.to_datetime(expiry, format="%d-%b-%Y", errors="coerce", cache=True)
+    if (parsed.isna() & expiry.notna()).any():
+        return expiry
+    return parsed
+
+# ==================================================
+# NUMBA KERNELS
+# ==================================================
+@njit(cache=True)
+def rolling_mean_fixed(x, window, min_periods, out):
+    """
+    Fixed-window rolling mean of x written into out, skipping NaNs.
+    Keeps a running sum and a parallel count of non-NaN values, so each
+    step is O(1) instead of O(window).
+    """
+    total = 0.0
+    count = 0
+    for i in range(len(x)):
+        if not np.isnan(x[i]):
+            total += x[i]
+            count += 1
+        if i >= window and not np.isnan(x[i - window]):
+            total -= x[i - window]
+            count -= 1
+        out[i] = total / count if count >= min_periods else np.nan
+
+
+@njit(cache=True)
+def diff(x, out):
+    """
+    First difference of x written into out (out[0] is NaN).
+    """
+    if len(x) == 0:
+        return
+    out[0] = np.nan
+    for i in range(1, len(x)):
+        out[i] = x[i] - x[i - 1]
+
+
+@njit(cache=True)
+def shift_neg1(x, out):
+    """
+    Next-row value of x written into out (out[-1] is NaN).
+    """
+    if len(x) == 0:
+        return
+    for i in range(len(x) - 1):
+        out[i] = x[i + 1]
+    out[len(x) - 1] = np.nan
+
+
+@njit(cache=True, error_model="numpy")
+def price_volume_signals(lo, hi, open_, close, volume, daily_change, is_loss, is_gain,
+                         volume_pct_change, next_volume, next_volume_pct_change):
+    """
+    Price and volume signals for the contract occupying rows lo..hi.
+    """
+    shift_neg1(volume[lo:hi], next_volume[lo:hi])
+
+    # The first day of a contract has no previous volume
+    volume_pct_change[lo] = np.nan
+    for i in range(lo + 1, hi):
+        volume_pct_change[i] = (volume[i] / volume[i - 1] - 1) * 100
+
+    for i in range(lo, hi):
+        # Price signals
+        daily_change[i] = close[i] - open_[i]
+        is_loss[i] = daily_change[i] < 0
+        is_gain[i] = daily_change[i] > 0
+
+        # Volume signals
+        next_volume_pct_change[i] = (next_volume[i] - volume[i]) / volume[i] * 100
+
+
+@njit(cache=True, error_model="numpy")
+def contract_signals_without_oi(starts, open_, close, volume):
+    """
+    Computes price and volume signals over contract-sorted arrays.
+    starts holds the first row of each contract (plus the total row count).
+    """
+    n = len(close)
+    daily_change = np.empty(n)
+    is_loss = np.empty(n, dtype=np.bool_)
+    is_gain = np.empty(n, dtype=np.bool_)
+    volume_pct_change = np.empty(n)
+    next_volume = np.empty(n)
+    next_volume_pct_change = np.empty(n)
+
+    for c in range(len(starts) - 1):
+        price_volume_signals(
+            starts[c], starts[c + 1], open_, close, volume, daily_change, is_loss, is_gain,
+            volume_pct_change, next_volume, next_volume_pct_change,
+        )
+
+    return (
+        daily_change, is_loss, is_gain, volume_pct_change,
+        next_volume, next_volume_pct_change,
+    )
+
+
+@njit(cache=True, error_model="numpy")
+def contract_signals_with_oi(starts, open_, close, volume, oi):
+    """
+    Computes price, volume and OI signals in one pass over contract-sorted arrays.
+    starts holds the first row of each contract (plus the total row count).
+    """
+    n = len(close)
+    daily_change = np.empty(n)
+    is_loss = np.empty(n, dtype=np.bool_)
+    is_gain = np.empty(n, dtype=np.bool_)
+    volume_pct_change = np.empty(n)
+    next_volume = np.empty(n)
+    next_volume_pct_change = np.empty(n)
+    oi_change = np.empty(n)
+    oi_avg = np.empty(n)
+    oi_normalized_change = np.empty(n)
+    next_oi = np.empty(n)
+    next_oi_change = np.empty(n)
+    next_oi_normalized_change = np.empty(n)
+
+    for c in range(len(starts) - 1):
+        lo = starts[c]
+        hi = starts[c + 1]
+
+        price_volume_signals(
+            lo, hi, open_, close, volume, daily_change, is_loss, is_gain,
+            volume_pct_change, next_volume, next_volume_pct_change,
+        )
+
+        # OI signals
+        diff(oi[lo:hi], oi_change[lo:hi])
+        rolling_mean_fixed(oi[lo:hi], OI_AVG_WINDOW, OI_AVG_MIN_PERIODS, oi_avg[lo:hi])
+        shift_neg1(oi[lo:hi], next_oi[lo:hi])
+
+        for i in range(lo, hi):
+            oi_normalized_change[i] = oi_change[i] / oi_avg[i]
+            next_oi_change[i] = next_oi[i] - oi[i]
+            next_oi_normalized_change[i] = next_oi_change[i] / oi_avg[i]
+
+    return (
+        daily_change, is_loss, is_gain, volume_pct_change,
+        oi_change, oi_avg, oi_normalized_change,
+        next_oi, next_oi_change, next_oi_normalized_change,
+        next_volume, next_volume_pct_change,
+    )
+
 # ==================================================
 # ANALYZE ONE CSV (CORE LOGIC)
 # ==================================================
-def analyze_single_dataframe(df_raw, instrument_name, base_instrument, oi_floor=2000):
+def _signal_inputs(df):
+    """
+    Drops contracts left with fewer than 2 rows and returns the contract
+    start offsets plus the float64 price/volume arrays used by the kernels.
+    """
+    df = df[df.groupby("Contract_ID", sort=False)["Date"].transform("size") >= 2]
+    df = df.reset_index(drop=True)
+
+    contract_ids = df["Contract_ID"].to_numpy()
+    starts = np.flatnonzero(contract_ids[1:] != contract_ids[:-1]) + 1
+    starts = np.concatenate(([0], starts, [len(df)]))
+
+    return (
+        df,
+        starts,
+        np.ascontiguousarray(df["Open"].to_numpy(), dtype=np.float64),
+        np.ascontiguousarray(df["Close"].to_numpy(), dtype=np.float64),
+        np.ascontiguousarray(df["No. of contracts"].to_numpy(), dtype=np.float64),
+    )
+
+
+def _analyze_with_oi(df, oi_floor):
+    """
+    Signals for a file that has Open Int: applies the OI floor, then
+    computes price, volume and OI signals.
+    """
+    # OI floor filter
+    prev_oi = df.groupby("Contract_ID", sort=False)["Open Int"].shift(1)
+    df = df[prev_oi >= oi_floor]
+
+    df, starts, open_, close, volume = _signal_inputs(df)
+    if df.empty:
+        return df
+
+    (
+        df["Daily_Change"], df["Is_Loss"], df["Is_Gain"], df["Volume_Pct_Change"],
+        df["OI_Change"], df["OI_20D_Avg"], df["OI_Normalized_Change"],
+        df["Next_Day_OI"], df["Next_Day_OI_Change"], df["Next_Day_OI_Normalized_Change"],
+        df["Next_Day_Volume"], df["Next_Day_Volume_Pct_Change"],
+    ) = contract_signals_with_oi(
+        starts, open_, close, volume,
+        np.ascontiguousarray(df["Open Int"].to_numpy(), dtype=np.float64),
+    )
+    return df
+
+
+def _analyze_without_oi(df):
+    """
+    Signals for a file without Open Int: price and volume signals only.
+    """
+    df, starts, open_, close, volume = _signal_inputs(df)
+    if df.empty:
+        return df
+
+    (
+        df["Daily_Change"], df["Is_Loss"], df["Is_Gain"], df["Volume_Pct_Change"],
+        df["Next_Day_Volume"], df["Next_Day_Volume_Pct_Change"],
+    ) = contract_signals_without_oi(starts, open_, close, volume)
+    return df
+
+
+def analyze_single_dataframe(df, instrument_name, base_instrument, oi_floor=2000):
     """
     Analyzes a single futures CSV file.
     Returns cleaned, contract-separated dataframe with all signals.
+    Modifies df in place, so pass a freshly read frame.
     """
-    df = df_raw.copy()
-    df.columns = df.columns.str.strip()
+    df.rename(columns=str.strip, inplace=True)
 
     # Validate required columns
     if "Date" not in df.columns:
         return pd.DataFrame()
 
-    # Parse dates
-    df["Date"] = pd.to_datetime(df["Date"], format="%d-%b-%Y", errors="coerce")
+    # Parse dates (cache=True parses each distinct date string only once)
+    df["Date"] = pd.to_datetime(df["Date"], format="%d-%b-%Y", errors="coerce", cache=True)
 
-    # Contract identification
+    # Contract identification (expiries are parsed too; datetime64 keys are
+    # much cheaper to group on than strings)
     if "Expiry" in df.columns:
+        df["Expiry"] = parse_expiry(df["Expiry"])
         df["Contract_ID"] = df["Expiry"]
     elif "Expiry_Date" in df.columns:
+        df["Expiry_Date"] = parse_expiry(df["Expiry_Date"])
         df["Contract_ID"] = df["Expiry_Date"]
     else:
         df["Contract_ID"] = df.index.astype(str)
 
     # Numeric conversion
+    has_oi = "Open Int" in df.columns
     numeric_cols = ["Open", "Close", "No. of contracts"]
-    if "Open Int" in df.columns:
+    if has_oi:
         numeric_cols.append("Open Int")
 
     for col in numeric_cols:
         if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+            # Fixed dtype, whatever the CSV reader inferred (int64 when a
+            # column has no "-" placeholders), so every file stages alike
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
 
     # Drop invalid rows
     required_cols = ["Open", "Close", "No. of contracts", "Date"]
     df = df.dropna(subset=required_cols)
-    df = df.sort_values(["Date", "Contract_ID"])
 
-    # Process each contract separately
-    all_contracts = []
+    # One stable sort leaves every contract's rows contiguous and in date order
+    df.sort_values(["Contract_ID", "Date"], kind="mergesort", inplace=True)
+
+    # Remove rollover noise (first 3 and last 3 days), skipping contracts
+    # with insufficient data
+    g = df.groupby("Contract_ID", sort=False)
+    day_num = g.cumcount()
+    contract_days = g["Date"].transform("size")
+    df = df[(contract_days > 6) & (day_num >= 3) & (day_num < contract_days - 3)]
 
-    for cid in df["Contract_ID"].unique():
-        cdf = df[df["Contract_ID"] == cid].copy()
-        cdf = cdf.sort_values("Date").reset_index(drop=True)
+    # Whether OI is present is a property of the file, so dispatch once
+    df = _analyze_with_oi(df, oi_floor) if has_oi else _analyze_without_oi(df)
 
-        # Skip contracts with insufficient data
-        if len(cdf) <= 6:
-            continue
+    if df.empty:
+        return pd.DataFrame()
 
-        # Remove rollover noise (first 3 and last 3 days)
-        cdf = cdf.iloc[3:-3].reset_index(drop=True)
+    # Downcast derived signals to float32 (halves memory moved by the reports)
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("float32")
 
-        # OI floor filter (if OI exists)
-        if "Open Int" in cdf.columns:
-            cdf = cdf[cdf["Open Int"].shift(1) >= oi_floor]
+    # Add instrument identifiers (both full name and base name)
+    df["Instrument"] = instrument_name
+    df["Base_Instrument"] = base_instrument
 
-        if len(cdf) < 2:
-            continue
+    return df
 
-        # === CORE SIGNALS ===
-        # Price signals
-        cdf["Daily_Change"] = cdf["Close"] - cdf["Open"]
-        cdf["Is_Loss"] = cdf["Daily_Change"] < 0
-        cdf["Is_Gain"] = cdf["Daily_Change"] > 0
 
-        # Volume signals
-        cdf["Volume_Pct_Change"] = cdf["No. of contracts"].pct_change() * 100
-
-        # OI signals (if available)
-        if "Open Int" in cdf.columns:
-            cdf["OI_Change"] = cdf["Open Int"].diff()
-            cdf["OI_20D_Avg"] = cdf["Open Int"].rolling(20, min_periods=5).mean()
-            cdf["OI_Normalized_Change"] = cdf["OI_Change"] / cdf["OI_20D_Avg"]
-
-            # Next-day OI response
-            cdf["Next_Day_OI"] = cdf["Open Int"].shift(-1)
-            cdf["Next_Day_OI_Change"] = cdf["Next_Day_OI"] - cdf["Open Int"]
-            cdf["Next_Day_OI_Normalized_Change"] = (
-                cdf["Next_Day_OI_Change"] / cdf["OI_20D_Avg"]
-            )
-
-        # Next-day volume response
-        cdf["Next_Day_Volume"] = cdf["No. of contracts"].shift(-1)
-        cdf["Next_Day_Volume_Pct_Change"] = (
-            (cdf["Next_Day_Volume"] - cdf["No. of contracts"]) 
-            / cdf["No. of contracts"] * 100
-        )
+# ==================================================
+# ANALYZE ENTIRE FOLDER
+# ==================================================
+def _process_file(file_path, work_folder, oi_floor=2000):
+    """
+    Reads and analyzes one CSV file (runs inside a worker process).
+    Writes the result to a parquet file in work_folder and returns its path
+    and row count (None and 0 when there is no usable data).
+    """
+    filename = os.path.basename(file_path)
+    instrument_name = filename.replace(".csv", "")
+    base_instrument = extract_base_instrument(filename)
 
-        # Add instrument identifiers (both full name and base name)
-        cdf["Instrument"] = instrument_name
-        cdf["Base_Instrument"] = base_instrument
-        cdf["Contract_ID"] = cid
+    df_analyzed = analyze_single_dataframe(read_futures_csv(file_path), instrument_name, base_instrument, oi_floor)
+    if df_analyzed.empty:
+        return None, 0
 
-        all_contracts.append(cdf)
+    # Fixed dtypes (datetime units vary with how a column was parsed)
+    for col in df_analyzed.columns.intersection(STAGED_FLOAT64_COLUMNS):
+        df_analyzed[col] = df_analyzed[col].astype("float64")
+    for col in df_analyzed.columns.intersection(STAGED_DATETIME_COLUMNS):
+        if pd.api.types.is_datetime64_any_dtype(df_analyzed[col]):
+            df_analyzed[col] = df_analyzed[col].astype("datetime64[ns]")
 
-    if not all_contracts:
-        return pd.DataFrame()
+    parquet_path = os.path.join(work_folder, f"{base_instrument}_{instrument_name}.parquet")
+    df_analyzed.to_parquet(parquet_path, compression="zstd", index=False)
+    return parquet_path, len(df_analyzed)
 
-    return pd.concat(all_contracts, ignore_index=True)
 
+def _read_staged(parquet_files):
+    """
+    Combines the staged parquet files into one dataframe.
+    The files are reopened as one Arrow dataset (columns missing from a file,
+    e.g. OI, become nulls); schemas that cannot be merged, such as raw string
+    expiries in one file and parsed dates in another, are combined in pandas.
+    """
+    try:
+        schema = pa.unify_schemas(
+            [pq.read_schema(path) for path in parquet_files], promote_options="permissive"
+        ).remove_metadata()
+        table = ds.dataset(parquet_files, schema=schema, format="parquet").to_table()
+        df_combined = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+    except pa.ArrowException as e:
+        print(f"Note: staged files have mismatched schemas ({e}); combining with pandas")
+        df_combined = pd.concat([pd.read_parquet(path) for path in parquet_files], ignore_index=True)
 
-# ==================================================
-# ANALYZE ENTIRE FOLDER
-# ==================================================
-def analyze_data_folder(data_folder_path=DATA_FOLDER, oi_floor=2000):
+    return df_combined
+
+
+def analyze_data_folder(data_folder_path=DATA_FOLDER, oi_floor=2000, work_folder=None):
     """
     Analyzes ALL CSV files in the data folder.
     Returns aggregated dataframe with all instruments and contracts.
+    Per-file results are streamed to parquet rather than held in memory
+    until the end, in a temporary folder unless work_folder is given.
     """
     if not os.path.exists(data_folder_path):
         raise FileNotFoundError(f"Data folder not found: {data_folder_path}")
 
-    all_data = []
     files_processed = 0
     files_failed = 0
 
@@ -161,143 +444,164 @@ def analyze_data_folder(data_folder_path=DATA_FOLDER, oi_floor=2000):
     
     print(f"Found {len(csv_files)} CSV file(s) to process\n")
 
-    for filename in csv_files:
-        file_path = os.path.join(data_folder_path, filename)
-        instrument_name = filename.replace(".csv", "")
-        base_instrument = extract_base_instrument(filename)
+    # Stage into a temporary folder unless the caller supplied one
+    staging = tempfile.TemporaryDirectory() if work_folder is None else contextlib.nullcontext(work_folder)
+    with staging as work_folder:
+        os.makedirs(work_folder, exist_ok=True)
 
+        results = {}
         try:
-            df_raw = pd.read_csv(file_path)
-            df_analyzed = analyze_single_dataframe(df_raw, instrument_name, base_instrument, oi_floor)
-
-            if not df_analyzed.empty:
-                all_data.append(df_analyzed)
-                files_processed += 1
-                print(f"✓ Processed: {filename} ({len(df_analyzed)} rows) -> Base: {base_instrument}")
-            else:
-                files_failed += 1
-                print(f"✗ Skipped: {filename} (insufficient data)")
+            # Each file is independent, so parse and analyze them in parallel
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                futures = {
+                    executor.submit(_process_file, os.path.join(data_folder_path, filename), work_folder, oi_floor): filename
+                    for filename in csv_files
+                }
+
+                for future in as_completed(futures):
+                    filename = futures[future]
+                    base_instrument = extract_base_instrument(filename)
+
+                    try:
+                        parquet_path, n_rows = future.result()
+
+                        if parquet_path is not None:
+                            results[filename] = parquet_path
+                            files_processed += 1
+                            print(f"✓ Processed: {filename} ({n_rows} rows) -> Base: {base_instrument}")
+                        else:
+                            files_failed += 1
+                            print(f"✗ Skipped: {filename} (insufficient data)")
+
+                    except Exception as e:
+                        files_failed += 1
+                        print(f"✗ Failed: {filename} - {str(e)}")
+
+            # Keep the original file order regardless of completion order
+            parquet_files = [results[filename] for filename in csv_files if filename in results]
+
+            print("=" * 60)
+            print(f"Summary: {files_processed} files processed, {files_failed} files skipped/failed")
+
+            if not parquet_files:
+                raise ValueError("No valid data found in any CSV files")
+
+            df_combined = _read_staged(parquet_files)
+        finally:
+            # Remove only the files this run staged, whether or not it succeeded
+            for path in results.values():
+                os.remove(path)
+
+    # Group keys as categoricals so report groupbys hash int codes, not strings
+    for col in ("Instrument", "Base_Instrument", "Contract_ID"):
+        df_combined[col] = df_combined[col].astype("category")
 
-        except Exception as e:
-            files_failed += 1
-            print(f"✗ Failed: {filename} - {str(e)}")
+    return df_combined
 
-    print("=" * 60)
-    print(f"Summary: {files_processed} files processed, {files_failed} files skipped/failed")
 
-    if not all_data:
-        raise ValueError("No valid data found in any CSV files")
-
-    # Combine all instruments and contracts
-    df_combined = pd.concat(all_data, ignore_index=True)
-    return df_combined
 
+# ==================================================
+# REPORT AGGREGATION
+# ==================================================
+def _aggregate_signals(df_work, keys, first_cols=(), date_range=False):
+    """
+    Aggregates day counts and after-loss/after-gain metrics per group of keys.
+    Groups are made contiguous by one stable sort and every metric is
+    computed with np.add.reduceat, so pandas' groupby machinery is bypassed.
+    first_cols are taken from each group's first row; date_range adds the
+    group's First_Date and Last_Date. Groups come out sorted by keys.
+    """
+    # One int64 code per row combining every key
+    key = np.zeros(len(df_work), dtype=np.int64)
+    for col in keys:
+        if isinstance(df_work[col].dtype, pd.CategoricalDtype):
+            codes = df_work[col].cat.codes.to_numpy()
+            n_values = len(df_work[col].cat.categories)
+        else:
+            codes, uniques = pd.factorize(df_work[col], sort=True)
+            n_values = len(uniques)
+        key = key * n_values + codes
+    
+    # Each file arrives sorted by contract, so the rows are already in runs;
+    # a stable sort guarantees contiguity and is near-linear on presorted runs
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    first_rows = order[starts]
+    
+    def column(col):
+        if col not in df_work.columns:
+            return np.full(len(df_work), np.nan)
+        return df_work[col].to_numpy(dtype=np.float64)[order]
+    
+    def masked_mean(values, mask):
+        # Sums run over the float64 copies made by column(), so float32
+        # signals come out as float64 means
+        valid = mask & ~np.isnan(values)
+        total = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        count = np.add.reduceat(valid.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / count
+    
+    is_loss = df_work['Is_Loss'].to_numpy(dtype=bool)[order]
+    is_gain = df_work['Is_Gain'].to_numpy(dtype=bool)[order]
+    oi_pctl = column('Next_Day_OI_Pctl')
+    next_volume_change = column('Next_Day_Volume_Pct_Change')
+    next_oi_normalized = column('Next_Day_OI_Normalized_Change')
+    oi_increase = column('Next_Day_OI_Change')
+    if 'Next_Day_OI_Change' in df_work.columns:
+        oi_increase = (oi_increase > 0).astype(np.float64)
+    
+    df_agg = pd.DataFrame({col: df_work[col].iloc[first_rows].to_numpy() for col in (*keys, *first_cols)})
+    if date_range:
+        dates = df_work['Date'].to_numpy()[order]
+        df_agg['First_Date'] = np.minimum.reduceat(dates, starts)
+        df_agg['Last_Date'] = np.maximum.reduceat(dates, starts)
+    df_agg['Total_Days'] = np.diff(np.r_[starts, len(key)])
+    df_agg['Loss_Days'] = np.add.reduceat(is_loss.astype(np.int64), starts)
+    df_agg['Gain_Days'] = np.add.reduceat(is_gain.astype(np.int64), starts)
+    for label, mask in (('Loss', is_loss), ('Gain', is_gain)):
+        df_agg[f'Avg_OI_Percentile_After{label}'] = masked_mean(oi_pctl, mask)
+        df_agg[f'Avg_NextDay_Volume_Change_After{label}'] = masked_mean(next_volume_change, mask)
+        df_agg[f'Avg_NextDay_OI_Normalized_After{label}'] = masked_mean(next_oi_normalized, mask)
+        df_agg[f'Pct_OI_Increase_After{label}'] = masked_mean(oi_increase, mask) * 100
+    
+    return df_agg
 
 
 # ==================================================
 # GENERATE COMPILED REPORT
 # ==================================================
-def generate_compiled_report(df_combined):
+def _compiled_report(df_work):
     """
     Generates contract-level compiled report with instrument-wise and overall averages.
     Now includes percentile rankings for OI changes.
     """
-    df_work = df_combined.copy()
-    
-    # Calculate percentiles for OI changes (global across all data)
-    if "Next_Day_OI_Normalized_Change" in df_work.columns:
-        df_work["Next_Day_OI_Pctl"] = (
-            df_work["Next_Day_OI_Normalized_Change"].rank(pct=True) * 100
-        )
-    
-    report_data = []
-    
     # Group by instrument and contract
-    for (instrument, contract_id), group in df_work.groupby(['Instrument', 'Contract_ID']):
-        loss_days = group[group['Is_Loss']]
-        gain_days = group[group['Is_Gain']]
-        
-        row = {
-            'Instrument': instrument,
-            'Base_Instrument': group['Base_Instrument'].iloc[0],
-            'Contract_ID': contract_id,
-            'Total_Days': len(group),
-            'Loss_Days': len(loss_days),
-            'Gain_Days': len(gain_days),
-        }
-        
-        # After-loss metrics with percentiles
-        if len(loss_days) > 0:
-            row['Avg_OI_Percentile_AfterLoss'] = loss_days['Next_Day_OI_Pctl'].mean() if 'Next_Day_OI_Pctl' in loss_days.columns else np.nan
-            row['Avg_NextDay_Volume_Change_AfterLoss'] = loss_days['Next_Day_Volume_Pct_Change'].mean()
-            row['Avg_NextDay_OI_Normalized_AfterLoss'] = loss_days['Next_Day_OI_Normalized_Change'].mean() if 'Next_Day_OI_Normalized_Change' in loss_days.columns else np.nan
-            row['Pct_OI_Increase_AfterLoss'] = (loss_days['Next_Day_OI_Change'] > 0).mean() * 100 if 'Next_Day_OI_Change' in loss_days.columns else np.nan
-        else:
-            row['Avg_OI_Percentile_AfterLoss'] = np.nan
-            row['Avg_NextDay_Volume_Change_AfterLoss'] = np.nan
-            row['Avg_NextDay_OI_Normalized_AfterLoss'] = np.nan
-            row['Pct_OI_Increase_AfterLoss'] = np.nan
-        
-        # After-gain metrics with percentiles
-        if len(gain_days) > 0:
-            row['Avg_OI_Percentile_AfterGain'] = gain_days['Next_Day_OI_Pctl'].mean() if 'Next_Day_OI_Pctl' in gain_days.columns else np.nan
-            row['Avg_NextDay_Volume_Change_AfterGain'] = gain_days['Next_Day_Volume_Pct_Change'].mean()
-            row['Avg_NextDay_OI_Normalized_AfterGain'] = gain_days['Next_Day_OI_Normalized_Change'].mean() if 'Next_Day_OI_Normalized_Change' in gain_days.columns else np.nan
-            row['Pct_OI_Increase_AfterGain'] = (gain_days['Next_Day_OI_Change'] > 0).mean() * 100 if 'Next_Day_OI_Change' in gain_days.columns else np.nan
-        else:
-            row['Avg_OI_Percentile_AfterGain'] = np.nan
-            row['Avg_NextDay_Volume_Change_AfterGain'] = np.nan
-            row['Avg_NextDay_OI_Normalized_AfterGain'] = np.nan
-            row['Pct_OI_Increase_AfterGain'] = np.nan
-        
-        report_data.append(row)
+    df_report = _aggregate_signals(df_work, ['Instrument', 'Contract_ID'], first_cols=['Base_Instrument'])
     
-    df_report = pd.DataFrame(report_data)
+    # Restore the report column order
+    df_report = df_report[list(REPORT_COLS)]
     df_report = df_report.sort_values(['Base_Instrument', 'Contract_ID'])
     
     # Calculate instrument-wise averages
     instrument_averages = []
-    for base_instrument in df_report['Base_Instrument'].unique():
-        inst_data = df_report[df_report['Base_Instrument'] == base_instrument]
-        
-        avg_row = {
-            'Instrument': f"{base_instrument} - AVERAGE",
-            'Base_Instrument': base_instrument,
-            'Contract_ID': '',
-            'Total_Days': inst_data['Total_Days'].sum(),
-            'Loss_Days': inst_data['Loss_Days'].sum(),
-            'Gain_Days': inst_data['Gain_Days'].sum(),
-            'Avg_OI_Percentile_AfterLoss': inst_data['Avg_OI_Percentile_AfterLoss'].mean(),
-            'Avg_NextDay_Volume_Change_AfterLoss': inst_data['Avg_NextDay_Volume_Change_AfterLoss'].mean(),
-            'Avg_NextDay_OI_Normalized_AfterLoss': inst_data['Avg_NextDay_OI_Normalized_AfterLoss'].mean(),
-            'Pct_OI_Increase_AfterLoss': inst_data['Pct_OI_Increase_AfterLoss'].mean(),
-            'Avg_OI_Percentile_AfterGain': inst_data['Avg_OI_Percentile_AfterGain'].mean(),
-            'Avg_NextDay_Volume_Change_AfterGain': inst_data['Avg_NextDay_Volume_Change_AfterGain'].mean(),
-            'Avg_NextDay_OI_Normalized_AfterGain': inst_data['Avg_NextDay_OI_Normalized_AfterGain'].mean(),
-            'Pct_OI_Increase_AfterGain': inst_data['Pct_OI_Increase_AfterGain'].mean(),
-        }
-        instrument_averages.append(avg_row)
+    for base_instrument, inst_data in df_report.groupby('Base_Instrument', observed=True, sort=False):
+        instrument_averages.append((
+            f"{base_instrument} - AVERAGE", base_instrument, '',
+            inst_data['Total_Days'].sum(), inst_data['Loss_Days'].sum(), inst_data['Gain_Days'].sum(),
+            *inst_data[list(METRIC_COLS)].mean(),
+        ))
     
     # Calculate overall average
-    overall_avg = {
-        'Instrument': 'OVERALL AVERAGE',
-        'Base_Instrument': 'ALL',
-        'Contract_ID': '',
-        'Total_Days': df_report['Total_Days'].sum(),
-        'Loss_Days': df_report['Loss_Days'].sum(),
-        'Gain_Days': df_report['Gain_Days'].sum(),
-        'Avg_OI_Percentile_AfterLoss': df_report['Avg_OI_Percentile_AfterLoss'].mean(),
-        'Avg_NextDay_Volume_Change_AfterLoss': df_report['Avg_NextDay_Volume_Change_AfterLoss'].mean(),
-        'Avg_NextDay_OI_Normalized_AfterLoss': df_report['Avg_NextDay_OI_Normalized_AfterLoss'].mean(),
-        'Pct_OI_Increase_AfterLoss': df_report['Pct_OI_Increase_AfterLoss'].mean(),
-        'Avg_OI_Percentile_AfterGain': df_report['Avg_OI_Percentile_AfterGain'].mean(),
-        'Avg_NextDay_Volume_Change_AfterGain': df_report['Avg_NextDay_Volume_Change_AfterGain'].mean(),
-        'Avg_NextDay_OI_Normalized_AfterGain': df_report['Avg_NextDay_OI_Normalized_AfterGain'].mean(),
-        'Pct_OI_Increase_AfterGain': df_report['Pct_OI_Increase_AfterGain'].mean(),
-    }
+    overall_avg = (
+        'OVERALL AVERAGE', 'ALL', '',
+        df_report['Total_Days'].sum(), df_report['Loss_Days'].sum(), df_report['Gain_Days'].sum(),
+        *df_report[list(METRIC_COLS)].mean(),
+    )
     
-    df_instrument_avg = pd.DataFrame(instrument_averages)
-    df_overall_avg = pd.DataFrame([overall_avg])
+    df_instrument_avg = pd.DataFrame.from_records(instrument_averages, columns=REPORT_COLS)
+    df_overall_avg = pd.DataFrame.from_records([overall_avg], columns=REPORT_COLS)
     
     df_final = pd.concat([df_report, df_instrument_avg, df_overall_avg], ignore_index=True)
     
@@ -311,68 +615,20 @@ def generate_compiled_report(df_combined):
 # ==================================================
 # GENERATE YEAR-WISE SUMMARY
 # ==================================================
-def generate_yearwise_summary(df_combined):
+def _yearwise_summary(df_work):
     """
     Generates year-wise aggregated metrics for each BASE instrument.
     Combines ALL quarterly contracts for an instrument in a given year into a SINGLE row.
     """
-    df_work = df_combined.copy()
-    df_work['Year'] = df_work['Date'].dt.year
-    
-    # Calculate percentiles for OI changes
-    if "Next_Day_OI_Normalized_Change" in df_work.columns:
-        df_work["Next_Day_OI_Pctl"] = (
-            df_work["Next_Day_OI_Normalized_Change"].rank(pct=True) * 100
-        )
-    
-    yearwise_data = []
-    
-    for (base_instrument, year), group in df_work.groupby(['Base_Instrument', 'Year']):
-        loss_days = group[group['Is_Loss']]
-        gain_days = group[group['Is_Gain']]
-        
-        # Create period description
-        min_date = group['Date'].min()
-        max_date = group['Date'].max()
-        period_str = f"{min_date.strftime('%d %b %Y')} to {max_date.strftime('%d %b %Y')}"
-        
-        row = {
-            'Instrument': base_instrument,
-            'Year': year,
-            'Period': period_str,
-            'Total_Days': len(group),
-            'Loss_Days': len(loss_days),
-            'Gain_Days': len(gain_days),
-        }
-        
-        # After-loss metrics
-        if len(loss_days) > 0:
-            row['Avg_OI_Percentile_AfterLoss'] = loss_days['Next_Day_OI_Pctl'].mean() if 'Next_Day_OI_Pctl' in loss_days.columns else np.nan
-            row['Avg_NextDay_Volume_Change_AfterLoss'] = loss_days['Next_Day_Volume_Pct_Change'].mean()
-            row['Avg_NextDay_OI_Normalized_AfterLoss'] = loss_days['Next_Day_OI_Normalized_Change'].mean() if 'Next_Day_OI_Normalized_Change' in loss_days.columns else np.nan
-            row['Pct_OI_Increase_AfterLoss'] = (loss_days['Next_Day_OI_Change'] > 0).mean() * 100 if 'Next_Day_OI_Change' in loss_days.columns else np.nan
-        else:
-            row['Avg_OI_Percentile_AfterLoss'] = np.nan
-            row['Avg_NextDay_Volume_Change_AfterLoss'] = np.nan
-            row['Avg_NextDay_OI_Normalized_AfterLoss'] = np.nan
-            row['Pct_OI_Increase_AfterLoss'] = np.nan
-        
-        # After-gain metrics
-        if len(gain_days) > 0:
-            row['Avg_OI_Percentile_AfterGain'] = gain_days['Next_Day_OI_Pctl'].mean() if 'Next_Day_OI_Pctl' in gain_days.columns else np.nan
-            row['Avg_NextDay_Volume_Change_AfterGain'] = gain_days['Next_Day_Volume_Pct_Change'].mean()
-            row['Avg_NextDay_OI_Normalized_AfterGain'] = gain_days['Next_Day_OI_Normalized_Change'].mean() if 'Next_Day_OI_Normalized_Change' in gain_days.columns else np.nan
-            row['Pct_OI_Increase_AfterGain'] = (gain_days['Next_Day_OI_Change'] > 0).mean() * 100 if 'Next_Day_OI_Change' in gain_days.columns else np.nan
-        else:
-            row['Avg_OI_Percentile_AfterGain'] = np.nan
-            row['Avg_NextDay_Volume_Change_AfterGain'] = np.nan
-            row['Avg_NextDay_OI_Normalized_AfterGain'] = np.nan
-            row['Pct_OI_Increase_AfterGain'] = np.nan
-        
-        yearwise_data.append(row)
+    # Groups already come out sorted by instrument and year
+    df_yearwise = _aggregate_signals(df_work, ['Base_Instrument', 'Year'], date_range=True)
     
-    df_yearwise = pd.DataFrame(yearwise_data)
-    df_yearwise = df_yearwise.sort_values(['Instrument', 'Year'])
+    # Create period description
+    df_yearwise['Period'] = (
+        df_yearwise['First_Date'].dt.strftime('%d %b %Y') + ' to '
+        + df_yearwise['Last_Date'].dt.strftime('%d %b %Y')
+    )
+    df_yearwise = df_yearwise.rename(columns={'Base_Instrument': 'Instrument'})[list(YEARWISE_COLS)]
     
     # Round numeric columns
     numeric_cols = df_yearwise.select_dtypes(include=[np.number]).columns
@@ -381,6 +637,41 @@ def generate_yearwise_summary(df_combined):
     return df_yearwise
 
 
+# ==================================================
+# GENERATE ALL REPORTS
+# ==================================================
+def generate_reports(df_combined):
+    """
+    Generates the compiled report and the year-wise summary in one pass.
+    OI percentiles are ranked once and shared by both reports.
+    The extra report columns are added with a single assign(); with pandas 3's
+    copy-on-write it shares the existing column arrays instead of copying the
+    combined frame (older pandas makes one full copy here).
+    """
+    new_cols = {'Year': df_combined['Date'].dt.year}
+    
+    # Calculate percentiles for OI changes (global across all data).
+    # Ranks from one argsort; tied values share their average rank, as with
+    # rank(pct=True), so the result does not depend on row order.
+    if "Next_Day_OI_Normalized_Change" in df_combined.columns:
+        x = df_combined["Next_Day_OI_Normalized_Change"].to_numpy(dtype=np.float64)
+        mask = ~np.isnan(x)
+        n_valid = mask.sum()
+        order = np.argsort(x[mask], kind="stable")
+        sorted_x = x[mask][order]
+        ranks = np.empty(n_valid)
+        ranks[order] = (
+            np.searchsorted(sorted_x, sorted_x, "left") + np.searchsorted(sorted_x, sorted_x, "right") + 1
+        ) / 2
+        pctl = np.full_like(x, np.nan)
+        pctl[mask] = ranks / n_valid * 100
+        new_cols['Next_Day_OI_Pctl'] = pctl
+    
+    df_work = df_combined.assign(**new_cols)
+    
+    return _compiled_report(df_work), _yearwise_summary(df_work)
+
+
 # ==================================================
 # MAIN EXECUTION FUNCTION
 # ==================================================
@@ -396,158 +687,108 @@ def run_full_analysis(output_filename=OUTPUT_FILE):
     df_combined = analyze_data_folder()
     print(f"\nTotal rows analyzed: {len(df_combined)}")
     print(f"Unique base instruments: {df_combined['Base_Instrument'].nunique()}")
-    print(f"Unique contracts: {len(df_combined.groupby(['Instrument', 'Contract_ID']))}")
+    print(f"Unique contracts: {len(df_combined.groupby(['Instrument', 'Contract_ID'], observed=True))}")
 
-    # Step 2: Generate compiled report
-    print("\nGenerating compiled report...")
-    df_report = generate_compiled_report(df_combined)
-    
-    # Step 3: Generate year-wise summary
-    print("Generating year-wise summary...")
-    df_yearwise = generate_yearwise_summary(df_combined)
-
-    # Step 4: Export to Excel using openpyxl
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils.dataframe import dataframe_to_rows
-    
-    wb = Workbook()
-    
-    # ===== SHEET 1: Compiled Analysis =====
-    ws1 = wb.active
-    ws1.title = 'Compiled_Analysis'
-    
-    # Write headers
-    headers = list(df_report.columns)
-    ws1.append(headers)
-    
-    # Format header row
-    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF', size=11)
-    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    
-    for cell in ws1[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-    
-    # Write data rows with conditional formatting
-    instrument_avg_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')
-    overall_avg_fill = PatternFill(start_color='C6E0B4', end_color='C6E0B4', fill_type='solid')
-    bold_font = Font(bold=True, size=11)
-    normal_font = Font(size=10)
-    center_align = Alignment(horizontal='center', vertical='center')
-    number_align = Alignment(horizontal='right', vertical='center')
-    
-    for idx, row in enumerate(dataframe_to_rows(df_report, index=False, header=False), start=2):
-        ws1.append(row)
+    # Step 2: Generate compiled report and year-wise summary
+    print("\nGenerating compiled report and year-wise summary...")
+    df_report, df_yearwise = generate_reports(df_combined)
+
+    # Step 3: Export to Excel using xlsxwriter
+    with pd.ExcelWriter(output_filename, engine='xlsxwriter', datetime_format='DD-MMM-YYYY') as writer:
+        df_report.to_excel(writer, sheet_name='Compiled_Analysis', index=False)
+        df_yearwise.to_excel(writer, sheet_name='YearWise_Summary', index=False)
+        wb = writer.book
         
-        instrument_name = str(row[0]) if row[0] is not None else ""
+        # Cell formats
+        header_format = {
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#4472C4', 'font_size': 11,
+            'align': 'center', 'valign': 'vcenter', 'text_wrap': True,
+        }
+        fmt_header = wb.add_format({**header_format, 'border': 1})
+        fmt_header_no_border = wb.add_format(header_format)
+        fmt_center = wb.add_format({'font_size': 10, 'align': 'center', 'valign': 'vcenter'})
+        fmt_number = wb.add_format({'font_size': 10, 'align': 'right', 'valign': 'vcenter'})
+        fmt_date = wb.add_format({'font_size': 10, 'align': 'right', 'valign': 'vcenter', 'num_format': 'DD-MMM-YYYY'})
+        fmt_border = wb.add_format({'border': 1})
+        fmt_instrument_avg = wb.add_format({'bold': True, 'bg_color': '#FFF2CC'})
+        fmt_overall_avg = wb.add_format({'bold': True, 'bg_color': '#C6E0B4'})
+        fmt_light = wb.add_format({'bg_color': '#F2F2F2'})
         
-        # Apply formatting based on row type
-        if "OVERALL AVERAGE" in instrument_name:
-            for cell in ws1[idx]:
-                cell.fill = overall_avg_fill
-                cell.font = bold_font
-                if cell.column > 2:
-                    cell.alignment = number_align
-                else:
-                    cell.alignment = center_align
-                    
-        elif "- AVERAGE" in instrument_name:
-            for cell in ws1[idx]:
-                cell.fill = instrument_avg_fill
-                cell.font = bold_font
-                if cell.column > 2:
-                    cell.alignment = number_align
-                else:
-                    cell.alignment = center_align
-        else:
-            for cell in ws1[idx]:
-                cell.font = normal_font
-                if cell.column > 2:
-                    cell.alignment = number_align
-                else:
-                    cell.alignment = center_align
-    
-    # Set column widths
-    column_widths = {
-        'A': 25, 'B': 15, 'C': 12, 'D': 12, 'E': 12,
-        'F': 30, 'G': 30, 'H': 25, 'I': 25,
-        'J': 30, 'K': 30, 'L': 25, 'M': 25,
-    }
-    
-    for col, width in column_widths.items():
-        ws1.column_dimensions[col].width = width
-    
-    # Add borders
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    for row in ws1.iter_rows(min_row=1, max_row=ws1.max_row, min_col=1, max_col=ws1.max_column):
-        for cell in row:
-            cell.border = thin_border
-    
-    # Freeze top row
-    ws1.freeze_panes = 'A2'
-    
-    # ===== SHEET 2: Year-Wise Summary =====
-    ws2 = wb.create_sheet('YearWise_Summary')
-    
-    yearwise_headers = list(df_yearwise.columns)
-    ws2.append(yearwise_headers)
-    
-    for cell in ws2[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_alignment
-    
-    for idx, row in enumerate(dataframe_to_rows(df_yearwise, index=False, header=False), start=2):
-        ws2.append(row)
+        # ===== SHEET 1: Compiled Analysis =====
+        ws1 = writer.sheets['Compiled_Analysis']
+        last_row, last_col = len(df_report), len(df_report.columns) - 1
         
-        for cell in ws2[idx]:
-            cell.font = normal_font
-            if cell.column > 3:
-                cell.alignment = number_align
-            else:
-                cell.alignment = center_align
-            cell.border = thin_border
-    
-    # Set column widths for Sheet 2
-    yearwise_column_widths = {
-        'A': 25, 'B': 10, 'C': 40, 'D': 12, 'E': 12, 'F': 12,
-        'G': 28, 'H': 30, 'I': 30, 'J': 25,
-        'K': 28, 'L': 30, 'M': 30, 'N': 25,
-    }
-    
-    for col, width in yearwise_column_widths.items():
-        ws2.column_dimensions[col].width = width
-    
-    ws2.freeze_panes = 'A2'
-    
-    # Add alternating row colors
-    light_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
-    current_instrument = None
-    use_light_fill = False
-    
-    for idx in range(2, ws2.max_row + 1):
-        instrument_value = ws2.cell(row=idx, column=1).value
+        # Format header row
+        for col, header in enumerate(df_report.columns):
+            ws1.write(0, col, header, fmt_header)
+        
+        # Set column widths (alignment is applied per column)
+        column_widths = {
+            'A': 25, 'B': 15, 'C': 12, 'D': 12, 'E': 12,
+            'F': 30, 'G': 30, 'H': 25, 'I': 25,
+            'J': 30, 'K': 30, 'L': 25, 'M': 25,
+        }
+        
+        # Every column is formatted, including those without a set width
+        for col_num in range(last_col + 1):
+            col = xl_col_to_name(col_num)
+            ws1.set_column(col_num, col_num, column_widths.get(col), fmt_center if col <= 'B' else fmt_number)
+        
+        # Expiry dates get pandas' own cell format, which overrides the column
+        # format, so rewrite them with one that keeps the alignment
+        contract_col = df_report.columns.get_loc('Contract_ID')
+        for row, value in enumerate(df_report['Contract_ID'], start=1):
+            if isinstance(value, pd.Timestamp):
+                ws1.write_datetime(row, contract_col, value.to_pydatetime(), fmt_date)
+        
+        # Highlight average rows and add borders
+        ws1.conditional_format(1, 0, last_row, last_col, {
+            'type': 'formula', 'criteria': '=ISNUMBER(SEARCH("OVERALL AVERAGE",$A2))',
+            'format': fmt_overall_avg,
+        })
+        ws1.conditional_format(1, 0, last_row, last_col, {
+            'type': 'formula', 'criteria': '=ISNUMBER(SEARCH("- AVERAGE",$A2))',
+            'format': fmt_instrument_avg,
+        })
+        ws1.conditional_format(1, 0, last_row, last_col, {
+            'type': 'formula', 'criteria': '=TRUE', 'format': fmt_border,
+        })
+        
+        # Freeze top row
+        ws1.freeze_panes(1, 0)
+        
+        # ===== SHEET 2: Year-Wise Summary =====
+        ws2 = writer.sheets['YearWise_Summary']
+        last_row, last_col = len(df_yearwise), len(df_yearwise.columns) - 1
+        
+        for col, header in enumerate(df_yearwise.columns):
+            ws2.write(0, col, header, fmt_header_no_border)
+        
+        # Set column widths for Sheet 2
+        yearwise_column_widths = {
+            'A': 25, 'B': 10, 'C': 40, 'D': 12, 'E': 12, 'F': 12,
+            'G': 28, 'H': 30, 'I': 30, 'J': 25,
+            'K': 28, 'L': 30, 'M': 30, 'N': 25,
+        }
+        
+        for col, width in yearwise_column_widths.items():
+            ws2.set_column(f'{col}:{col}', width, fmt_center if col <= 'C' else fmt_number)
+        
+        # Add alternating row colors (one rule per instrument block)
+        instruments = df_yearwise['Instrument'].to_numpy()
+        block_starts = [0] + [i for i in range(1, len(instruments)) if instruments[i] != instruments[i - 1]]
+        block_ends = block_starts[1:] + [len(instruments)]
         
-        if instrument_value != current_instrument:
-            current_instrument = instrument_value
-            use_light_fill = not use_light_fill
+        for start, end in list(zip(block_starts, block_ends))[::2]:
+            ws2.conditional_format(start + 1, 0, end, last_col, {
+                'type': 'formula', 'criteria': '=TRUE', 'format': fmt_light,
+            })
+        ws2.conditional_format(1, 0, last_row, last_col, {
+            'type': 'formula', 'criteria': '=TRUE', 'format': fmt_border,
+        })
         
-        if use_light_fill:
-            for cell in ws2[idx]:
-                if cell.fill.start_color.rgb != header_fill.start_color.rgb:
-                    cell.fill = light_fill
+        ws2.freeze_panes(1, 0)
     
-    # Save workbook
-    wb.save(output_filename)
     full_path = os.path.abspath(output_filename)
         
     print(f"\n✓ Analysis complete!")